@@ -1,7 +1,10 @@
 import asyncio
+import contextlib
 import json
 import os
 import sys
+from collections import deque
+from dataclasses import dataclass
 from datetime import datetime
 from abc import ABC
 
@@ -13,10 +16,16 @@ from PyQt6.QtWidgets import (
     QTextEdit, QSplitter, QGroupBox, QHeaderView, QMessageBox, QInputDialog,
     QStatusBar, QTabWidget
 )
-from PyQt6.QtCore import Qt, QTimer, pyqtSignal, QObject
+from PyQt6.QtCore import Qt, QTimer
 import qasync
 from qasync import asyncSlot
 
+REFERENCE_CURRENCY = 'USDT'
+MIN_NOTIONAL = 1
+MAX_OPEN_ORDERS_PER_SYMBOL = 10
+DUST = 1e-12
+
+
 def is_valid_proxy(proxy):
     if not proxy:
         return False
@@ -98,15 +107,407 @@ async def fetch_order(exchange, order_id, symbol):
         return None
 
 
-class TaskManager(QObject):
-    task_updated = pyqtSignal(str, dict)
-    log_message = pyqtSignal(str)
-    
+def order_amount_for(exchange, symbol, amount, price):
+    limits = exchange.markets[symbol].get('limits', {})
+    min_amount = limits.get('amount', {}).get('min') or 0
+    min_cost = limits.get('cost', {}).get('min') or 0
+    try:
+        order_amount = float(exchange.amount_to_precision(symbol, amount))
+    except Exception:
+        return None
+    if order_amount <= 0 or order_amount < min_amount or order_amount * price < min_cost:
+        return None
+    return order_amount
+
+
+def ladder_prices(low_price, high_price, levels):
+    if levels <= 1 or high_price <= low_price:
+        return [low_price] * levels
+    step = (high_price - low_price) / (levels - 1)
+    return [low_price + step * i for i in range(levels)]
+
+
+def ladder_plan(exchange, symbol, amount, low_price, high_price, levels):
+    for count in range(levels, 0, -1):
+        plan = []
+        left = amount
+        prices = ladder_prices(low_price, high_price, count)
+        for i, price in enumerate(prices):
+            part = left if i == count - 1 else amount / count
+            order_amount = order_amount_for(exchange, symbol, part, price)
+            if not order_amount:
+                break
+            plan.append((order_amount, price))
+            left -= order_amount
+        else:
+            return plan
+    return []
+
+
+async def stream_order_updates(exchange, symbol, get_order_ids, wakeup=None, poll_interval=5, resync_interval=30):
+    use_ws = exchange.has.get('watchOrders')
+    watch_task = None
+    wake_task = None
+    try:
+        while True:
+            if wakeup is not None and wake_task is None:
+                wake_task = asyncio.ensure_future(wakeup.wait())
+
+            if use_ws:
+                if watch_task is None:
+                    watch_task = asyncio.ensure_future(exchange.watch_orders(symbol))
+                waiters = {watch_task, wake_task} - {None}
+                done, _ = await asyncio.wait(waiters, timeout=resync_interval, return_when=asyncio.FIRST_COMPLETED)
+                if watch_task in done:
+                    finished, watch_task = watch_task, None
+                    try:
+                        orders = finished.result()
+                    except Exception:
+                        use_ws = False
+                    else:
+                        yield orders
+                        continue
+                if wake_task in done:
+                    wake_task = None
+                    wakeup.clear()
+                    yield []
+                    continue
+
+            orders = []
+            for order_id in get_order_ids():
+                order = await fetch_order(exchange, order_id, symbol)
+                if order:
+                    orders.append(order)
+            yield orders
+            if not use_ws:
+                if wake_task is None:
+                    await asyncio.sleep(poll_interval)
+                else:
+                    done, _ = await asyncio.wait({wake_task}, timeout=poll_interval)
+                    if done:
+                        wake_task = None
+                        wakeup.clear()
+    finally:
+        for pending in (watch_task, wake_task):
+            if pending is not None:
+                pending.cancel()
+
+
+async def stream_order_book(exchange, symbol, poll_interval=2):
+    use_ws = exchange.has.get('watchOrderBook')
+    while True:
+        if use_ws:
+            try:
+                yield await exchange.watch_order_book(symbol)
+                continue
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                use_ws = False
+        yield await exchange.fetch_order_book(symbol)
+        await asyncio.sleep(poll_interval)
+
+
+class SellRouter:
+    def __init__(self, total_amount, min_price, depth=20):
+        self.requested = total_amount
+        self.remaining = total_amount
+        self.committed = 0
+        self.min_price = min_price
+        self.depth = depth
+        self.books = {}
+        self.balances = {}
+        self.fees = {}
+        self.levels = {}
+        self.allocated = {}
+        self.allocation = {}
+
+    @property
+    def capped(self):
+        return self.remaining + self.committed < self.requested
+
+    def set_venue(self, venue, balance, fee=0):
+        self.balances[venue] = balance
+        self.fees[venue] = fee or 0
+        self.remaining = min(self.requested, sum(self.balances.values())) - self.committed
+        self._rebuild_levels(venue)
+
+    def update_book(self, venue, bids):
+        self.books[venue] = [(bid[0], bid[1]) for bid in bids[:self.depth]]
+        self._rebuild_levels(venue)
+
+    def set_min_price(self, min_price):
+        if min_price == self.min_price:
+            return
+        self.min_price = min_price
+        for venue in self.books:
+            self._rebuild_levels(venue)
+
+    def commit(self, venue, amount):
+        self.balances[venue] -= amount
+        self.remaining -= amount
+        self.committed += amount
+        self.allocated[venue] = max(self.allocated.get(venue, 0) - amount, 0)
+        self._rebuild_levels(venue)
+
+    def release(self, venue, amount):
+        self.balances[venue] += amount
+        self.remaining += amount
+        self.committed -= amount
+        self._rebuild_levels(venue)
+
+    def _rebuild_levels(self, venue):
+        levels = []
+        capacity = self.balances.get(venue, 0)
+        net = 1 - self.fees.get(venue, 0)
+        for price, amount in self.books.get(venue, []):
+            if capacity <= 0 or price < self.min_price:
+                break
+            take = min(amount, capacity)
+            levels.append((price * net, price, take))
+            capacity -= take
+        self.levels[venue] = levels
+
+    def top_of_book(self):
+        return {venue: book[0] for venue, book in self.books.items() if book}
+
+    def _margin(self, venue):
+        allocated = self.allocated.get(venue, 0)
+        worst = None
+        for net_price, price, amount in self.levels[venue]:
+            if allocated <= DUST:
+                return worst, (net_price, price, amount)
+            taken = min(amount, allocated)
+            worst = (net_price, price, taken)
+            allocated -= taken
+            if amount - taken > DUST:
+                return worst, (net_price, price, amount - taken)
+        return worst, None
+
+    def _move(self, venue, amount):
+        self.allocated[venue] = max(self.allocated.get(venue, 0) + amount, 0)
+
+    def rebalance(self, exclude=()):
+        venues = [venue for venue in self.levels if venue not in exclude]
+        for venue in list(self.allocated):
+            capacity = 0 if venue in exclude else sum(level[2] for level in self.levels.get(venue, []))
+            self.allocated[venue] = min(self.allocated[venue], capacity)
+
+        left = self.remaining - sum(self.allocated.values())
+        while True:
+            margins = {venue: self._margin(venue) for venue in venues}
+            worst = min(
+                ((margin[0], venue) for venue, margin in margins.items() if margin[0]),
+                default=None
+            )
+            if left < -DUST and worst:
+                (_, _, amount), venue = worst
+                take = min(amount, -left)
+                self._move(venue, -take)
+                left += take
+                continue
+
+            best = max(
+                ((margin[1], venue) for venue, margin in margins.items() if margin[1]),
+                default=None
+            )
+            if best is None:
+                break
+            (best_price, _, best_amount), best_venue = best
+            if left > DUST:
+                take = min(best_amount, left)
+                self._move(best_venue, take)
+                left -= take
+                continue
+            if worst is None or best_price <= worst[0][0]:
+                break
+            (_, _, worst_amount), worst_venue = worst
+            take = min(best_amount, worst_amount)
+            self._move(worst_venue, -take)
+            self._move(best_venue, take)
+
+        allocation = {}
+        for venue in venues:
+            worst, _ = self._margin(venue)
+            if worst and self.allocated.get(venue, 0) > DUST:
+                allocation[venue] = (self.allocated[venue], worst[1])
+
+        changed = {
+            venue for venue in allocation.keys() | self.allocation.keys()
+            if allocation.get(venue) != self.allocation.get(venue)
+        }
+        self.allocation = allocation
+        return changed
+
+
+class TickerSnapshot:
+    def __init__(self, ttl=5):
+        self.ttl = ttl
+        self.tickers = {}
+        self.updated_at = {}
+        self.bulk_failed_at = None
+        self._lock = asyncio.Lock()
+        self._graph = None
+        self._rates = {}
+
+    async def refresh(self, exchange, symbol):
+        async with self._lock:
+            now = asyncio.get_running_loop().time()
+            bulk = exchange.has.get('fetchTickers')
+            if bulk and self.bulk_failed_at is not None and now - self.bulk_failed_at < self.ttl:
+                bulk = False
+            updated_at = self.updated_at.get(None if bulk else symbol)
+            if updated_at is not None and now - updated_at < self.ttl:
+                return
+
+            self._graph = None
+            self._rates = {}
+            if bulk:
+                try:
+                    self.tickers = await exchange.fetch_tickers()
+                    self.tickers.setdefault(symbol, None)
+                    self.updated_at = {None: now}
+                    return
+                except Exception:
+                    self.bulk_failed_at = now
+
+            try:
+                self.tickers[symbol] = await exchange.fetch_ticker(symbol)
+            except Exception:
+                self.tickers[symbol] = None
+            self.updated_at[symbol] = now
+
+    def last_price(self, symbol):
+        ticker = self.tickers.get(symbol) or {}
+        return ticker.get('last') or ticker.get('close') or ticker.get('bid') or 0
+
+    def _build_graph(self):
+        graph = {}
+        for symbol in self.tickers:
+            if ':' in symbol or '/' not in symbol:
+                continue
+            price = self.last_price(symbol)
+            if not price:
+                continue
+            base, quote = symbol.split('/')
+            graph.setdefault(base, {})[quote] = price
+            graph.setdefault(quote, {})[base] = 1 / price
+        return graph
+
+    def rate(self, asset, reference=REFERENCE_CURRENCY):
+        if asset == reference:
+            return 1
+        if reference not in self._rates:
+            if self._graph is None:
+                self._graph = self._build_graph()
+            rates = {reference: 1}
+            queue = [reference]
+            for current in queue:
+                for neighbour, price in self._graph.get(current, {}).items():
+                    if neighbour not in rates:
+                        rates[neighbour] = rates[current] / price
+                        queue.append(neighbour)
+            self._rates[reference] = rates
+        return self._rates[reference].get(asset)
+
+    def convert(self, amount, asset, reference=REFERENCE_CURRENCY):
+        rate = self.rate(asset, reference)
+        if rate is None:
+            return None
+        return amount * rate
+
+
+def is_sellable(snapshot, exchange, symbol, token_balance, sell_price):
+    if token_balance <= 0 or not order_amount_for(exchange, symbol, token_balance, sell_price):
+        return False
+    notional = snapshot.convert(token_balance, exchange.markets[symbol]['base'])
+    if notional is None:
+        return True
+    return notional > MIN_NOTIONAL
+
+
+@dataclass(frozen=True)
+class TaskStatusEvent:
+    task_id: str
+    exchange: str
+    symbol: str
+    price: str
+    in_order: float
+    status: str
+
+
+@dataclass(frozen=True)
+class LogEvent:
+    message: str
+
+
+class Subscription:
+    def __init__(self, maxsize=1000):
+        self.statuses = {}
+        self.logs = deque(maxlen=maxsize)
+        self.dropped = 0
+        self._ready = asyncio.Event()
+
+    def push(self, event):
+        if isinstance(event, TaskStatusEvent):
+            self.statuses.pop(event.task_id, None)
+            self.statuses[event.task_id] = event
+        else:
+            if len(self.logs) == self.logs.maxlen:
+                self.dropped += 1
+            self.logs.append(event)
+        self._ready.set()
+
+    async def get_batch(self):
+        await self._ready.wait()
+        self._ready.clear()
+        statuses = list(self.statuses.values())
+        logs = list(self.logs)
+        dropped = self.dropped
+        self.statuses.clear()
+        self.logs.clear()
+        self.dropped = 0
+        return statuses, logs, dropped
+
+
+class EventBus:
     def __init__(self):
-        super().__init__()
+        self.subscriptions = []
+
+    def subscribe(self, maxsize=1000):
+        subscription = Subscription(maxsize)
+        self.subscriptions.append(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        if subscription in self.subscriptions:
+            self.subscriptions.remove(subscription)
+
+    def publish(self, event):
+        for subscription in self.subscriptions:
+            subscription.push(event)
+
+
+class TaskManager:
+    def __init__(self):
+        self.events = EventBus()
         self.tasks = {}
         self.loaded_markets = {}
+        self.ticker_snapshots = {}
         
+    def publish_status(self, task_id, task_data):
+        self.events.publish(TaskStatusEvent(
+            task_id=task_id,
+            exchange=task_data['exchange'],
+            symbol=task_data['symbol'],
+            price=task_data['price'],
+            in_order=task_data['in_order'],
+            status=task_data['status']
+        ))
+
+    def log(self, message):
+        self.events.publish(LogEvent(message))
+
     async def fetch_balance_and_sell_loop(self, task_id, exchange_key, exchange_class, keys, proxy, symbol):
         symbol = symbol.upper()
         current_exchange = None
@@ -127,13 +528,12 @@ class TaskManager(QObject):
                 balance = await current_exchange.fetch_balance()
                 token = symbol.split('/')[0]
 
-                ticker = await current_exchange.fetch_ticker(symbol)
-                last_price = ticker.get('last', 0)
-
-                token_balance = balance['free'].get(token, 0)
-                equivalent_in_usdt = token_balance * last_price
+                snapshot = self.ticker_snapshots.setdefault(exchange_key, TickerSnapshot())
+                await snapshot.refresh(current_exchange, symbol)
 
+                token_balance = balance['free'].get(token) or 0
                 sell_price = self.tasks[task_id]["price"]
+                sellable = is_sellable(snapshot, current_exchange, symbol, token_balance, sell_price)
                 order_id = self.tasks[task_id].get("order_id")
 
                 task_data.update({
@@ -155,13 +555,13 @@ class TaskManager(QObject):
                             self.tasks[task_id]["order_id"] = None
                             task_data['status'] = "Исполнен"
                     else:
-                        if equivalent_in_usdt < 1:
+                        if not sellable:
                             self.tasks[task_id]["order_id"] = None
                             task_data['status'] = "Исполнен"
                         else:
                             task_data['status'] = "Нет ордера"
                 else:
-                    if equivalent_in_usdt > 1:
+                    if sellable:
                         amount_to_sell = token_balance
                         orders = await sell_in_parts(current_exchange, symbol, amount_to_sell, sell_price)
 
@@ -173,7 +573,7 @@ class TaskManager(QObject):
                             task_data['in_order'] = order_amount
                             task_data['status'] = "Ордер создан"
                             
-                            self.log_message.emit(
+                            self.log(
                                 f"[{exchange_key}] Ордер создан: {symbol}, "
                                 f"Количество={order_amount}, Цена={sell_price}"
                             )
@@ -182,30 +582,452 @@ class TaskManager(QObject):
                     else:
                         task_data['status'] = "Недостаточно средств"
 
-                self.task_updated.emit(task_id, task_data)
+                self.publish_status(task_id, task_data)
                 await asyncio.sleep(5)
 
             except asyncio.CancelledError:
                 task_data['status'] = "Отменено"
-                self.task_updated.emit(task_id, task_data)
+                self.publish_status(task_id, task_data)
                 return
             except Exception as e:
-                self.log_message.emit(f"[{exchange_key}] Ошибка: {e}")
+                self.log(f"[{exchange_key}] Ошибка: {e}")
                 task_data['status'] = "Ошибка, переподключение..."
-                self.task_updated.emit(task_id, task_data)
+                self.publish_status(task_id, task_data)
                 current_exchange = None
                 await asyncio.sleep(10)
 
+    def task_coroutine(self, task_id):
+        task = self.tasks[task_id]
+        if task.get("type") == "router":
+            return self.cross_exchange_sell_loop(task_id, task["venues"], task["symbol"])
+        if task.get("type") in ("ladder", "iceberg"):
+            return self.execution_loop(
+                task_id, task["exchange_key"], task["exchange_class"],
+                task["keys"], task["proxy"], task["symbol"]
+            )
+        return self.fetch_balance_and_sell_loop(
+            task_id, task["exchange_key"], task["exchange_class"],
+            task["keys"], task["proxy"], task["symbol"]
+        )
+
+    async def _watch_venue_book(self, router, venue, exchange, symbol, wakeup):
+        while True:
+            try:
+                async for order_book in stream_order_book(exchange, symbol):
+                    router.update_book(venue, order_book.get('bids', []))
+                    wakeup.set()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.log(f"[{venue}] Ошибка стакана {symbol}: {e}")
+                await asyncio.sleep(10)
+
+    async def _sync_router_orders(self, router, exchanges, open_orders, symbol):
+        filled = 0
+        top_of_book = router.top_of_book()
+        for venue, (order_id, _) in list(open_orders.items()):
+            exchange = exchanges[venue]
+            order = await fetch_order(exchange, order_id, symbol)
+            if not order:
+                continue
+
+            remaining = order.get('remaining') or 0
+            best_bid = top_of_book.get(venue)
+            is_stale = best_bid and order.get('price') and best_bid[0] < order['price']
+            if order.get('status') == 'open' and remaining > 0 and is_stale:
+                try:
+                    await exchange.cancel_order(order_id, symbol)
+                except Exception as e:
+                    self.log(f"[{venue}] Ошибка отмены ордера {order_id}: {e}")
+                    continue
+                order = await fetch_order(exchange, order_id, symbol) or order
+                remaining = order.get('remaining') or 0
+
+            if order.get('status') == 'open' and remaining > 0:
+                continue
+
+            filled += order.get('filled') or 0
+            if remaining > 0:
+                router.release(venue, remaining)
+            del open_orders[venue]
+        return filled
+
+    async def _route_orders(self, router, exchanges, open_orders, symbol):
+        rejected = set()
+        while True:
+            router.rebalance(exclude=open_orders.keys() | rejected)
+            pending = [venue for venue in router.allocation if venue not in open_orders]
+            invalid = {
+                venue for venue in pending
+                if not order_amount_for(exchanges[venue], symbol, *router.allocation[venue])
+            }
+            if not invalid:
+                break
+            rejected |= invalid
+
+        placed_any = False
+        for venue in pending:
+            placed = await self._place_router_order(router, venue, exchanges[venue], symbol)
+            if placed:
+                open_orders[venue] = placed
+                placed_any = True
+        return placed_any
+
+    async def _place_router_order(self, router, venue, exchange, symbol):
+        target_amount, limit_price = router.allocation[venue]
+        order_amount = order_amount_for(exchange, symbol, target_amount, limit_price)
+        if not order_amount:
+            return None
+
+        try:
+            order = await sell_token(exchange, symbol, order_amount, limit_price)
+        except Exception as e:
+            self.log(f"[{venue}] Ошибка создания ордера: {e}")
+            return None
+
+        router.commit(venue, order_amount)
+        self.log(
+            f"[{venue}] Роутер: ордер создан {symbol}, "
+            f"Количество={order_amount}, Цена={limit_price}"
+        )
+        return order.get('id'), order_amount
+
+    async def _close_router_orders(self, exchanges, open_orders, symbol):
+        filled = 0
+        for venue, (order_id, amount) in open_orders.items():
+            exchange = exchanges[venue]
+            try:
+                await exchange.cancel_order(order_id, symbol)
+            except Exception as e:
+                self.log(f"[{venue}] Ошибка отмены ордера {order_id}: {e}")
+            order = await fetch_order(exchange, order_id, symbol)
+            filled += (order.get('filled') or 0) if order else amount
+        open_orders.clear()
+        return filled
+
+    def _router_exhausted(self, router, exchanges, symbol):
+        top_of_book = router.top_of_book()
+        for venue, exchange in exchanges.items():
+            amount = min(router.remaining, router.balances[venue])
+            price = max(top_of_book.get(venue, (router.min_price,))[0], router.min_price)
+            if amount > 0 and order_amount_for(exchange, symbol, amount, price):
+                return False
+        return True
+
+    async def cross_exchange_sell_loop(self, task_id, venues, symbol):
+        symbol = symbol.upper()
+        min_price = self.tasks[task_id]["price"]
+        task_data = {
+            'exchange': ', '.join(venues),
+            'symbol': symbol,
+            'price': f"{min_price:.10f}".rstrip('0').rstrip('.'),
+            'in_order': 0,
+            'status': 'Инициализация'
+        }
+
+        while True:
+            try:
+                await self._run_router(task_id, venues, symbol, task_data)
+                self.publish_status(task_id, task_data)
+                return
+            except asyncio.CancelledError:
+                task_data['status'] = "Отменено"
+                self.publish_status(task_id, task_data)
+                return
+            except Exception as e:
+                self.log(f"[{task_data['exchange']}] Ошибка роутера: {e}")
+                task_data['status'] = "Ошибка, переподключение..."
+                self.publish_status(task_id, task_data)
+                await asyncio.sleep(10)
+
+    async def _run_router(self, task_id, venues, symbol, task_data):
+        task = self.tasks[task_id]
+        token = symbol.split('/')[0]
+        amount = task["amount"] - task.get("filled", 0)
+        router = SellRouter(amount, task["price"])
+        open_orders = {}
+        filled = 0
+        wakeup = asyncio.Event()
+        watchers = []
+        loop = asyncio.get_running_loop()
+
+        async with contextlib.AsyncExitStack() as stack:
+            exchanges = {}
+            try:
+                for venue, (exchange_class, keys, proxy) in venues.items():
+                    try:
+                        exc = await stack.enter_async_context(BaseExchange(exchange_class, keys, proxy))
+                        balance = await exc.exchange.fetch_balance()
+                    except Exception as e:
+                        self.log(f"[{venue}] Ошибка: {e}")
+                        continue
+
+                    token_balance = balance['free'].get(token) or 0
+                    if token_balance <= 0 or symbol not in exc.exchange.markets:
+                        continue
+                    exchanges[venue] = exc.exchange
+                    router.set_venue(venue, token_balance, exc.exchange.markets[symbol].get('taker'))
+
+                if not exchanges:
+                    task_data['status'] = "Недостаточно средств"
+                    return
+
+                task_data['exchange'] = ', '.join(exchanges)
+                if router.capped:
+                    self.log(
+                        f"[{task_data['exchange']}] Роутер: баланса хватает только на "
+                        f"{router.remaining} из {amount} {token}"
+                    )
+                for venue, exchange in exchanges.items():
+                    watchers.append(asyncio.create_task(
+                        self._watch_venue_book(router, venue, exchange, symbol, wakeup)
+                    ))
+
+                last_sync = 0
+                while open_orders or not self._router_exhausted(router, exchanges, symbol):
+                    try:
+                        await asyncio.wait_for(wakeup.wait(), timeout=5)
+                    except asyncio.TimeoutError:
+                        pass
+                    wakeup.clear()
+
+                    sell_price = task["price"]
+                    router.set_min_price(sell_price)
+
+                    if open_orders and loop.time() - last_sync >= 5:
+                        filled += await self._sync_router_orders(router, exchanges, open_orders, symbol)
+                        last_sync = loop.time()
+
+                    if await self._route_orders(router, exchanges, open_orders, symbol):
+                        last_sync = loop.time()
+
+                    task_data.update({
+                        'price': f"{sell_price:.10f}".rstrip('0').rstrip('.'),
+                        'in_order': router.committed - filled,
+                        'status': f"Работает ({len(open_orders)} орд.)" if open_orders else "Ожидание стакана"
+                    })
+                    self.publish_status(task_id, task_data)
+
+                task_data['in_order'] = 0
+                task_data['status'] = "Исполнен частично" if router.capped else "Исполнен"
+
+            except (asyncio.CancelledError, Exception):
+                filled += await self._close_router_orders(exchanges, open_orders, symbol)
+                raise
+            finally:
+                task["filled"] = task.get("filled", 0) + filled
+                for watcher in watchers:
+                    watcher.cancel()
+                await asyncio.gather(*watchers, return_exceptions=True)
+
+    async def _place_slice(self, exchange_key, exchange, symbol, amount, price):
+        order_amount = order_amount_for(exchange, symbol, amount, price)
+        if not order_amount:
+            return None
+        try:
+            order = await sell_token(exchange, symbol, order_amount, price)
+        except Exception as e:
+            self.log(f"[{exchange_key}] Ошибка создания ордера: {e}")
+            return None
+
+        self.log(
+            f"[{exchange_key}] Ордер создан: {symbol}, "
+            f"Количество={order_amount}, Цена={price}"
+        )
+        for field, value in (('amount', order_amount), ('remaining', order_amount), ('price', price)):
+            if order.get(field) is None:
+                order[field] = value
+        return order
+
+    async def _open_orders_budget(self, exchange, symbol):
+        if not exchange.has.get('fetchOpenOrders'):
+            return MAX_OPEN_ORDERS_PER_SYMBOL
+        try:
+            existing = await exchange.fetch_open_orders(symbol)
+        except Exception:
+            existing = []
+        return max(MAX_OPEN_ORDERS_PER_SYMBOL - len(existing), 0)
+
+    async def execution_loop(self, task_id, exchange_key, exchange_class, keys, proxy, symbol):
+        symbol = symbol.upper()
+        task_data = {
+            'exchange': exchange_key,
+            'symbol': symbol,
+            'price': f"{self.tasks[task_id]['price']:.10f}".rstrip('0').rstrip('.'),
+            'in_order': 0,
+            'status': 'Инициализация'
+        }
+
+        while True:
+            try:
+                await self._run_execution(task_id, exchange_key, exchange_class, keys, proxy, symbol, task_data)
+                self.publish_status(task_id, task_data)
+                return
+            except asyncio.CancelledError:
+                task_data['status'] = "Отменено"
+                self.publish_status(task_id, task_data)
+                return
+            except Exception as e:
+                self.log(f"[{exchange_key}] Ошибка: {e}")
+                task_data['status'] = "Ошибка, переподключение..."
+                self.publish_status(task_id, task_data)
+                await asyncio.sleep(10)
+
+    async def _run_execution(self, task_id, exchange_key, exchange_class, keys, proxy, symbol, task_data):
+        token = symbol.split('/')[0]
+        task = self.tasks[task_id]
+        task["wakeup"] = asyncio.Event()
+        open_orders = {}
+        filled = 0
+
+        try:
+            async with BaseExchange(exchange_class, keys, proxy) as exc:
+                exchange = exc.exchange
+                balance = await exchange.fetch_balance()
+                free = balance['free'].get(token) or 0
+                if task.get("amount"):
+                    total_amount = min(task["amount"] - task.get("filled", 0), free)
+                else:
+                    total_amount = free
+                budget = await self._open_orders_budget(exchange, symbol)
+                current_price = task["price"]
+
+                if budget <= 0:
+                    task_data['status'] = "Лимит открытых ордеров"
+                    return
+
+                if task["type"] == "ladder":
+                    levels = min(task["levels"], budget)
+                    plan = ladder_plan(exchange, symbol, total_amount, current_price, task["price_high"], levels)
+                    for amount, price in plan:
+                        order = await self._place_slice(exchange_key, exchange, symbol, amount, price)
+                        if order:
+                            open_orders[order['id']] = order
+                    hidden = 0
+                else:
+                    hidden = total_amount
+
+                def top_up():
+                    nonlocal hidden
+                    visible = sum(order.get('remaining') or 0 for order in open_orders.values())
+                    if hidden <= 0 or visible >= task["visible"] or len(open_orders) >= budget:
+                        return None
+                    amount = min(task["visible"] - visible, hidden)
+                    if hidden - amount < task["visible"] * 0.01:
+                        amount = hidden
+                    return amount
+
+                async def refill():
+                    nonlocal hidden
+                    amount = top_up()
+                    if amount and not order_amount_for(exchange, symbol, amount, current_price):
+                        if not open_orders:
+                            hidden = 0
+                        return
+                    if amount:
+                        order = await self._place_slice(exchange_key, exchange, symbol, amount, current_price)
+                        if order:
+                            open_orders[order['id']] = order
+                            hidden -= order['amount']
+
+                def report():
+                    in_order = sum(order.get('remaining') or 0 for order in open_orders.values())
+                    task_data.update({
+                        'price': f"{current_price:.10f}".rstrip('0').rstrip('.'),
+                        'in_order': in_order,
+                        'status': f"Выполняется ({len(open_orders)} орд., исполнено {filled})"
+                    })
+                    self.publish_status(task_id, task_data)
+
+                if task["type"] == "iceberg":
+                    await refill()
+                if not open_orders:
+                    task_data['status'] = "Недостаточно средств"
+                    return
+                report()
+
+                updates = stream_order_updates(exchange, symbol, lambda: list(open_orders), task["wakeup"])
+                async with contextlib.aclosing(updates):
+                    async for orders in updates:
+                        cancelled = []
+                        for order in orders:
+                            order_id = order.get('id')
+                            if order_id not in open_orders:
+                                continue
+                            if order.get('status') == 'open':
+                                open_orders[order_id] = order
+                                continue
+                            filled += order.get('filled') or 0
+                            price = open_orders.pop(order_id).get('price')
+                            if order.get('status') == 'canceled' and order.get('remaining'):
+                                cancelled.append((order['remaining'], order.get('price') or price))
+
+                        if task["price"] != current_price:
+                            delta = task["price"] - current_price
+                            current_price = task["price"]
+                            if task["type"] == "ladder":
+                                task["price_high"] += delta
+                            for order_id, order in list(open_orders.items()):
+                                try:
+                                    await exchange.cancel_order(order_id, symbol)
+                                except Exception as e:
+                                    self.log(f"[{exchange_key}] Ошибка отмены ордера {order_id}: {e}")
+                                    continue
+                                order = await fetch_order(exchange, order_id, symbol) or order
+                                del open_orders[order_id]
+                                filled += order.get('filled') or 0
+                                if order.get('remaining'):
+                                    cancelled.append((order['remaining'], (order.get('price') or current_price) + delta))
+
+                        if task["type"] == "iceberg":
+                            hidden += sum(amount for amount, _ in cancelled)
+                            await refill()
+                        if task["type"] == "ladder":
+                            for amount, price in cancelled:
+                                order = await self._place_slice(exchange_key, exchange, symbol, amount, price)
+                                if order:
+                                    open_orders[order['id']] = order
+                                else:
+                                    self.log(f"[{exchange_key}] Не удалось перевыставить {amount} {token} по цене {price}")
+                        if not open_orders and hidden <= 0:
+                            break
+                        report()
+
+                task_data['in_order'] = 0
+                task_data['status'] = "Исполнен"
+
+        except (asyncio.CancelledError, Exception):
+            filled += sum(order.get('filled') or 0 for order in open_orders.values())
+            await self._cancel_orders(exchange_key, exchange_class, keys, proxy, open_orders, symbol)
+            raise
+        finally:
+            task["filled"] = task.get("filled", 0) + filled
+            task.pop("wakeup", None)
+
+    async def _cancel_orders(self, exchange_key, exchange_class, keys, proxy, open_orders, symbol):
+        if not open_orders:
+            return
+        try:
+            async with BaseExchange(exchange_class, keys, proxy) as exc:
+                for order_id in list(open_orders):
+                    try:
+                        await exc.exchange.cancel_order(order_id, symbol)
+                        del open_orders[order_id]
+                    except Exception as e:
+                        self.log(f"[{exchange_key}] Ошибка отмены ордера {order_id}: {e}")
+        except Exception as e:
+            self.log(f"[{exchange_key}] Ошибка отмены ордеров: {e}")
+
     async def load_exchange_markets(self, exchange_key, exchange_class, keys, proxy):
         try:
             if exchange_key not in self.loaded_markets:
                 async with BaseExchange(exchange_class, keys, proxy) as current_exchange:
                     markets = current_exchange.exchange.markets
                     self.loaded_markets[exchange_key] = markets
-                    self.log_message.emit(f"Загружено {len(markets)} символов для {exchange_key}")
+                    self.log(f"Загружено {len(markets)} символов для {exchange_key}")
             return list(self.loaded_markets[exchange_key].keys())
         except Exception as e:
-            self.log_message.emit(f"Ошибка загрузки markets для {exchange_key}: {e}")
+            self.log(f"Ошибка загрузки markets для {exchange_key}: {e}")
             return []
 
     async def get_current_price(self, exchange_key, exchange_class, keys, proxy, symbol):
@@ -215,7 +1037,7 @@ class TaskManager(QObject):
                 ticker = await current_exchange.exchange.fetch_ticker(symbol)
                 return ticker.get('last')
         except Exception as e:
-            self.log_message.emit(f"Ошибка получения цены для {symbol}: {e}")
+            self.log(f"Ошибка получения цены для {symbol}: {e}")
             return None
 
 
@@ -223,6 +1045,7 @@ class SellerMainWindow(QMainWindow):
     def __init__(self):
         super().__init__()
         self.task_manager = TaskManager()
+        self.event_consumer = None
         self.setup_ui()
         self.setup_connections()
         self.load_config()
@@ -250,6 +1073,8 @@ class SellerMainWindow(QMainWindow):
     def showEvent(self, event):
         super().showEvent(event)
         QTimer.singleShot(0, self._start_load_markets)
+        if self.event_consumer is None:
+            self.event_consumer = asyncio.ensure_future(self.consume_events())
 
     @asyncSlot()
     async def _start_load_markets(self):
@@ -276,6 +1101,11 @@ class SellerMainWindow(QMainWindow):
         self.price_edit = QLineEdit()
         exchange_layout.addWidget(self.price_edit, 2, 1)
 
+        exchange_layout.addWidget(QLabel("Тип задачи:"), 3, 0)
+        self.task_type_combo = QComboBox()
+        self.task_type_combo.addItems(list(self.get_task_types().keys()))
+        exchange_layout.addWidget(self.task_type_combo, 3, 1)
+
         buttons_layout = QHBoxLayout()
         
         self.create_order_btn = QPushButton("Создать ордер")
@@ -283,13 +1113,15 @@ class SellerMainWindow(QMainWindow):
         self.resume_task_btn = QPushButton("Возобновить")
         self.edit_price_btn = QPushButton("Изменить цену")
         self.delete_task_btn = QPushButton("Удалить задачу")
+        self.create_router_btn = QPushButton("Роутер продаж")
 
         buttons_layout.addWidget(self.create_order_btn)
         buttons_layout.addWidget(self.cancel_task_btn)
         buttons_layout.addWidget(self.resume_task_btn)
         buttons_layout.addWidget(self.edit_price_btn)
         buttons_layout.addWidget(self.delete_task_btn)
-        exchange_layout.addLayout(buttons_layout, 3, 0, 1, 2)
+        buttons_layout.addWidget(self.create_router_btn)
+        exchange_layout.addLayout(buttons_layout, 4, 0, 1, 2)
         layout.addWidget(exchange_group)
 
         splitter = QSplitter(Qt.Orientation.Horizontal)
@@ -333,9 +1165,7 @@ class SellerMainWindow(QMainWindow):
         self.resume_task_btn.clicked.connect(self.resume_task)
         self.edit_price_btn.clicked.connect(self.edit_price)
         self.delete_task_btn.clicked.connect(self.delete_task)
-
-        self.task_manager.task_updated.connect(self.update_task_in_table)
-        self.task_manager.log_message.connect(self.add_log_message)
+        self.create_router_btn.clicked.connect(self.create_router_task)
 
     def setup_dark_theme(self):
         self.setStyleSheet("""
@@ -504,6 +1334,10 @@ class SellerMainWindow(QMainWindow):
             QMessageBox.warning(self, "Ошибка", f"Символ {symbol} не найден на бирже {exchange_name}!")
             return
 
+        task_params = self.ask_task_params(price)
+        if task_params is None:
+            return
+
         exchange_class = self.get_supported_exchanges()[exchange_name]
         proxy = self.config.get("proxy_keys")
 
@@ -515,16 +1349,91 @@ class SellerMainWindow(QMainWindow):
             "exchange_class": exchange_class,
             "keys": keys,
             "proxy": proxy,
-            "order_id": None
+            "order_id": None,
+            **task_params
         }
 
         self.add_task_to_table(task_id, exchange_name, symbol, f"{price:.10f}".rstrip('0').rstrip('.'), 0, "Запуск...")
 
-        task = asyncio.create_task(
-            self.task_manager.fetch_balance_and_sell_loop(
-                task_id, exchange_name, exchange_class, keys, proxy, symbol
+        task = asyncio.create_task(self.task_manager.task_coroutine(task_id))
+        self.task_manager.tasks[task_id]["task"] = task
+
+    def get_task_types(self):
+        return {
+            "Лимит": "limit",
+            "Лестница": "ladder",
+            "Айсберг": "iceberg",
+        }
+
+    def ask_task_params(self, price):
+        task_type = self.get_task_types()[self.task_type_combo.currentText()]
+        if task_type == "ladder":
+            price_high, ok = QInputDialog.getDouble(
+                self, "Лестница", "Верхняя цена:", price, price, 1e18, decimals=10
+            )
+            if not ok:
+                return None
+            levels, ok = QInputDialog.getInt(
+                self, "Лестница", "Количество уровней:", 5, 1, MAX_OPEN_ORDERS_PER_SYMBOL
+            )
+            if not ok:
+                return None
+            return {"type": task_type, "price_high": price_high, "levels": levels, "amount": None}
+        if task_type == "iceberg":
+            visible, ok = QInputDialog.getDouble(
+                self, "Айсберг", "Видимый объем:", 0, 0, 1e18, decimals=10
             )
+            if not ok or visible <= 0:
+                return None
+            return {"type": task_type, "visible": visible, "amount": None}
+        return {"type": task_type}
+
+    def create_router_task(self):
+        symbol = self.symbol_combo.currentText().upper()
+        price_str = self.price_edit.text()
+
+        if not all([symbol, price_str]):
+            QMessageBox.warning(self, "Ошибка", "Заполните все поля!")
+            return
+
+        try:
+            price = float(price_str)
+        except ValueError:
+            QMessageBox.warning(self, "Ошибка", "Неверный формат цены!")
+            return
+
+        proxy = self.config.get("proxy_keys")
+        venues = {}
+        for exchange_name, exchange_class in self.get_supported_exchanges().items():
+            keys = self.config.get(exchange_name.lower() + "_keys", {})
+            markets = self.task_manager.loaded_markets.get(exchange_name, {})
+            if keys and symbol in markets:
+                venues[exchange_name] = (exchange_class, keys, proxy)
+
+        if not venues:
+            QMessageBox.warning(self, "Ошибка", f"Символ {symbol} не найден ни на одной бирже!")
+            return
+
+        amount, ok = QInputDialog.getDouble(
+            self, "Роутер продаж", "Количество токенов:", 0, 0, 1e18, decimals=10
         )
+        if not ok or amount <= 0:
+            return
+
+        task_id = str(len(self.task_manager.tasks) + 1)
+        self.task_manager.tasks[task_id] = {
+            "type": "router",
+            "exchange_key": ', '.join(venues),
+            "symbol": symbol,
+            "price": price,
+            "amount": amount,
+            "venues": venues,
+            "order_id": None
+        }
+
+        self.add_task_to_table(task_id, ', '.join(venues), symbol, f"{price:.10f}".rstrip('0').rstrip('.'), 0, "Запуск...")
+
+        task = asyncio.create_task(self.task_manager.task_coroutine(task_id))
         self.task_manager.tasks[task_id]["task"] = task
 
     def add_task_to_table(self, task_id, exchange, symbol, price, in_order, status):
@@ -539,17 +1448,36 @@ class SellerMainWindow(QMainWindow):
         
         self.tasks_table.item(row, 0).setData(Qt.ItemDataRole.UserRole, task_id)
 
-    def update_task_in_table(self, task_id, task_data):
+    async def consume_events(self, refresh_interval=0.2):
+        subscription = self.task_manager.events.subscribe()
+        try:
+            while True:
+                statuses, logs, dropped = await subscription.get_batch()
+                try:
+                    if statuses:
+                        self.update_tasks_in_table(statuses)
+                    for event in logs:
+                        self.add_log_message(event.message)
+                    if dropped:
+                        self.add_log_message(f"Пропущено {dropped} сообщений лога")
+                except Exception as e:
+                    self.add_log_message(f"Ошибка обновления интерфейса: {e}")
+                await asyncio.sleep(refresh_interval)
+        finally:
+            self.task_manager.events.unsubscribe(subscription)
+
+    def update_tasks_in_table(self, events):
+        events = {event.task_id: event for event in events}
         for row in range(self.tasks_table.rowCount()):
             item = self.tasks_table.item(row, 0)
-            if item and item.data(Qt.ItemDataRole.UserRole) == task_id:
-                self.tasks_table.setItem(row, 0, QTableWidgetItem(task_data['exchange']))
-                self.tasks_table.setItem(row, 1, QTableWidgetItem(task_data['symbol']))
-                self.tasks_table.setItem(row, 2, QTableWidgetItem(task_data['price']))
-                self.tasks_table.setItem(row, 3, QTableWidgetItem(str(task_data['in_order'])))
-                self.tasks_table.setItem(row, 4, QTableWidgetItem(task_data['status']))
-                self.tasks_table.item(row, 0).setData(Qt.ItemDataRole.UserRole, task_id)
-                break
+            event = events.get(item.data(Qt.ItemDataRole.UserRole)) if item else None
+            if event:
+                self.tasks_table.setItem(row, 0, QTableWidgetItem(event.exchange))
+                self.tasks_table.setItem(row, 1, QTableWidgetItem(event.symbol))
+                self.tasks_table.setItem(row, 2, QTableWidgetItem(event.price))
+                self.tasks_table.setItem(row, 3, QTableWidgetItem(str(event.in_order)))
+                self.tasks_table.setItem(row, 4, QTableWidgetItem(event.status))
+                self.tasks_table.item(row, 0).setData(Qt.ItemDataRole.UserRole, event.task_id)
 
     def get_selected_task_id(self):
         current_row = self.tasks_table.currentRow()
@@ -587,12 +1515,7 @@ class SellerMainWindow(QMainWindow):
             self.add_log_message(f"Задача {task_id} уже выполняется")
             return
 
-        new_task = asyncio.create_task(
-            self.task_manager.fetch_balance_and_sell_loop(
-                task_id, task_data["exchange_key"], task_data["exchange_class"],
-                task_data["keys"], task_data["proxy"], task_data["symbol"]
-            )
-        )
+        new_task = asyncio.create_task(self.task_manager.task_coroutine(task_id))
         self.task_manager.tasks[task_id]["task"] = new_task
         self.add_log_message(f"Задача {task_id} возобновлена")
 
@@ -609,6 +1532,9 @@ class SellerMainWindow(QMainWindow):
 
         if ok:
             self.task_manager.tasks[task_id]["price"] = new_price
+            wakeup = self.task_manager.tasks[task_id].get("wakeup")
+            if wakeup:
+                wakeup.set()
             asyncio.create_task(self._update_active_order_price(task_id, new_price))
             self.add_log_message(f"Цена задачи {task_id} изменена на {new_price}")
 
@@ -0,0 +1,178 @@
+import asyncio
+
+import pytest
+
+pytest.importorskip("ccxt")
+pytest.importorskip("PyQt6.QtWidgets")
+pytest.importorskip("qasync")
+
+import main
+
+
+SYMBOL = "T/USDT"
+
+
+class FakeExchange:
+    bid = None
+    balance = 0
+    min_amount = None
+
+    def __init__(self, options):
+        self.has = {}
+        self.markets = {
+            SYMBOL: {
+                'symbol': SYMBOL,
+                'base': 'T',
+                'taker': 0,
+                'limits': {'amount': {'min': self.min_amount}, 'cost': {}},
+            }
+        }
+
+    async def load_markets(self):
+        return self.markets
+
+    async def close(self):
+        pass
+
+    async def fetch_balance(self):
+        return {'free': {'T': self.balance}}
+
+    async def fetch_order_book(self, symbol):
+        return {'bids': [[self.bid, 1000]]}
+
+    def amount_to_precision(self, symbol, amount):
+        return str(amount)
+
+    async def create_limit_sell_order(self, symbol, amount, price):
+        order = {
+            'id': f"{type(self).__name__}-{len(self.orders)}",
+            'status': 'closed',
+            'amount': amount,
+            'filled': amount,
+            'remaining': 0,
+            'price': float(price),
+        }
+        self.orders[order['id']] = order
+        return order
+
+    async def fetch_order(self, order_id, symbol):
+        return self.orders[order_id]
+
+    async def cancel_order(self, order_id, symbol):
+        pass
+
+
+class VenueA(FakeExchange):
+    bid = 10
+    balance = 100
+    orders = {}
+
+
+class VenueB(FakeExchange):
+    bid = 11
+    balance = 5
+    min_amount = 10
+    orders = {}
+
+
+def test_router_moves_share_from_venue_below_minimum():
+    manager = main.TaskManager()
+    subscription = manager.events.subscribe()
+    venues = {"A": (VenueA, {}, None), "B": (VenueB, {}, None)}
+    manager.tasks["1"] = {
+        "type": "router",
+        "symbol": SYMBOL,
+        "price": 1,
+        "amount": 100,
+        "venues": venues,
+        "order_id": None,
+    }
+
+    asyncio.run(asyncio.wait_for(manager.task_coroutine("1"), timeout=30))
+
+    assert not VenueB.orders
+    assert sum(order['amount'] for order in VenueA.orders.values()) == 100
+    assert manager.tasks["1"]["filled"] == 100
+    assert subscription.statuses["1"].status == "Исполнен"
+
+
+class FailingTickersExchange:
+    has = {'fetchTickers': True}
+
+    async def fetch_tickers(self):
+        raise Exception("rate limit")
+
+    async def fetch_ticker(self, symbol):
+        return {'last': 2}
+
+
+def test_ticker_snapshot_falls_back_when_bulk_fetch_fails():
+    snapshot = main.TickerSnapshot()
+
+    asyncio.run(snapshot.refresh(FailingTickersExchange(), SYMBOL))
+
+    assert snapshot.convert(3, 'T') == 6
+
+
+class LadderVenue(FakeExchange):
+    balance = 30
+    orders = {}
+    fail_balance = True
+
+    async def fetch_balance(self):
+        if LadderVenue.fail_balance:
+            LadderVenue.fail_balance = False
+            raise Exception("timeout")
+        return await super().fetch_balance()
+
+    async def create_limit_sell_order(self, symbol, amount, price):
+        order = await super().create_limit_sell_order(symbol, amount, price)
+        order.update(status='open', filled=0, remaining=amount)
+        return order
+
+    async def cancel_order(self, order_id, symbol):
+        self.orders[order_id]['status'] = 'canceled'
+
+
+def test_ladder_retries_and_reprices_open_levels(monkeypatch):
+    sleep = asyncio.sleep
+
+    async def fast_sleep(delay):
+        await sleep(min(delay, 0.05))
+
+    monkeypatch.setattr(asyncio, "sleep", fast_sleep)
+    manager = main.TaskManager()
+    subscription = manager.events.subscribe()
+    manager.tasks["1"] = {
+        "type": "ladder",
+        "exchange_key": "L",
+        "exchange_class": LadderVenue,
+        "keys": {},
+        "proxy": None,
+        "symbol": SYMBOL,
+        "price": 1.0,
+        "price_high": 2.0,
+        "levels": 3,
+        "amount": None,
+        "order_id": None,
+    }
+
+    async def scenario():
+        task = asyncio.create_task(manager.task_coroutine("1"))
+        while len(LadderVenue.orders) < 3:
+            await sleep(0.01)
+        manager.tasks["1"]["price"] = 1.5
+        manager.tasks["1"]["wakeup"].set()
+        while len(LadderVenue.orders) < 6:
+            await sleep(0.01)
+        for order in LadderVenue.orders.values():
+            if order['status'] == 'open':
+                order.update(status='closed', filled=order['amount'], remaining=0)
+        await asyncio.wait_for(task, timeout=5)
+
+    asyncio.run(scenario())
+
+    filled_prices = sorted(o['price'] for o in LadderVenue.orders.values() if o['status'] == 'closed')
+    assert filled_prices == [1.5, 2.0, 2.5]
+    assert manager.tasks["1"]["filled"] == 30
+    assert subscription.statuses["1"].status == "Исполнен"